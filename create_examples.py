@@ -3,30 +3,27 @@
 Example script showing how to use the polargraph converter
 """
 
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont
-import subprocess
 import os
+from polargraph_converter import convert_to_grayscale, generate_svg
 
 # Create examples directory
 os.makedirs('examples', exist_ok=True)
 
 # Example 1: Simple gradient
 print("Creating gradient example...")
-img = Image.new('L', (300, 200), color=255)
-draw = ImageDraw.Draw(img)
-for x in range(300):
-    gray = int(255 - (x / 300 * 255))
-    draw.line([(x, 0), (x, 200)], fill=gray)
+gradient = (255 - np.arange(300) / 300 * 255).astype(np.uint8)
+img = Image.fromarray(np.broadcast_to(gradient, (200, 300)).copy())
 img.save('examples/gradient.png')
 
 # Convert to SVG
-subprocess.run([
-    'python', 'polargraph_converter.py',
-    'examples/gradient.png',
-    '-o', 'examples/gradient.svg',
-    '-l', '5',
-    '-a', '12'
-])
+generate_svg(
+    convert_to_grayscale('examples/gradient.png'),
+    line_spacing=5,
+    amplitude_scale=12,
+    output_path='examples/gradient.svg'
+)
 
 # Example 2: Circles pattern
 print("\nCreating circles example...")
@@ -42,13 +39,12 @@ for i in range(5):
 img.save('examples/circles.png')
 
 # Convert to SVG
-subprocess.run([
-    'python', 'polargraph_converter.py',
-    'examples/circles.png',
-    '-o', 'examples/circles.svg',
-    '-l', '4',
-    '-a', '10'
-])
+generate_svg(
+    convert_to_grayscale('examples/circles.png'),
+    line_spacing=4,
+    amplitude_scale=10,
+    output_path='examples/circles.svg'
+)
 
 # Example 3: Text
 print("\nCreating text example...")
@@ -62,13 +58,12 @@ draw.polygon([(260, 110), (310, 110), (285, 40)], fill=40)
 img.save('examples/shapes.png')
 
 # Convert to SVG
-subprocess.run([
-    'python', 'polargraph_converter.py',
-    'examples/shapes.png',
-    '-o', 'examples/shapes.svg',
-    '-l', '3',
-    '-a', '15'
-])
+generate_svg(
+    convert_to_grayscale('examples/shapes.png'),
+    line_spacing=3,
+    amplitude_scale=15,
+    output_path='examples/shapes.svg'
+)
 
 print("\nExamples created in 'examples/' directory!")
 print("View the .svg files to see the Polargraph output.")
@@ -3,36 +3,39 @@
 Demo script showing various Polargraph converter capabilities
 """
 
-import subprocess
-import sys
+import contextlib
+import io
+import numpy as np
 from PIL import Image, ImageDraw
+from polargraph_converter import convert_to_grayscale, generate_svg
 
 def run_converter(input_file, output_file, line_spacing, amplitude):
     """Run the converter with specific parameters"""
-    cmd = [
-        'python', 'polargraph_converter.py',
-        input_file, '-o', output_file,
-        '-l', str(line_spacing), '-a', str(amplitude)
-    ]
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode == 0:
-        print(f"✓ Created {output_file}")
-    else:
-        print(f"✗ Failed: {result.stderr}")
-    return result.returncode == 0
+    try:
+        # Keep the converter's own progress output quiet; errors still go to stderr
+        with contextlib.redirect_stdout(io.StringIO()):
+            generate_svg(
+                convert_to_grayscale(input_file),
+                line_spacing=line_spacing,
+                amplitude_scale=amplitude,
+                output_path=output_file
+            )
+    except (SystemExit, Exception) as e:
+        # Report any converter failure and keep going, as with the old subprocess runs
+        print(f"✗ Failed: {output_file}" + ("" if isinstance(e, SystemExit) else f" ({e})"))
+        return False
+    print(f"✓ Created {output_file}")
+    return True
 
 def main():
     print("=== Polargraph Converter Demo ===\n")
     
     # Create a demo image
     print("Creating demo image...")
-    img = Image.new('L', (400, 300), color=255)
-    draw = ImageDraw.Draw(img)
-    
     # Draw gradient background
-    for y in range(300):
-        gray = int(255 - (y / 300 * 200))
-        draw.line([(0, y), (400, y)], fill=gray)
+    gradient = (255 - np.arange(300) / 300 * 200).astype(np.uint8)
+    img = Image.fromarray(np.broadcast_to(gradient[:, np.newaxis], (300, 400)).copy())
+    draw = ImageDraw.Draw(img)
     
     # Add some shapes
     draw.ellipse([100, 80, 300, 220], fill=80, outline=20)
@@ -5,10 +5,16 @@ Converts images to SVG format optimized for pen plotter/Polargraph drawing.
 """
 
 import argparse
+import io
 import math
-import random
+import os
 import sys
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
+import numpy as np
 from PIL import Image
 
 
@@ -24,6 +30,10 @@ def convert_to_grayscale(image_path):
     """
     try:
         img = Image.open(image_path)
+        if img.mode == 'L':
+            # Already grayscale: decode now instead of copying via convert()
+            img.load()
+            return img
         return img.convert('L')
     except Exception as e:
         print(f"Error loading image: {e}", file=sys.stderr)
@@ -35,16 +45,17 @@ def get_pixel_darkness(gray_value):
     Convert grayscale value to darkness factor (0=white, 1=black).
     
     Args:
-        gray_value: Grayscale pixel value (0-255)
+        gray_value: Grayscale pixel value (0-255), or an array of them
         
     Returns:
-        Darkness factor between 0 and 1
+        Darkness factor between 0 and 1 (array input gives an array of the same shape)
     """
     return 1.0 - (gray_value / 255.0)
 
 
 def generate_wave_line_segments(y, width, darkness_values, line_spacing, amplitude_scale, 
-                                darkness_threshold=0.1, organic=False, random_seed=None, frequency_only=False):
+                                darkness_threshold=0.1, organic=False, random_seed=None, frequency_only=False,
+                                x_positions=None):
     """
     Generate wavy horizontal line segments based on pixel darkness values.
     Only creates line segments where darkness exceeds threshold (skips white background).
@@ -52,178 +63,232 @@ def generate_wave_line_segments(y, width, darkness_values, line_spacing, amplitu
     Args:
         y: Y coordinate of the line
         width: Image width
-        darkness_values: List of darkness values for each x position
+        darkness_values: Array of darkness values for each x position
         line_spacing: Vertical spacing between lines
         amplitude_scale: Scaling factor for wave amplitude
         darkness_threshold: Minimum darkness to draw a line (0.1 = skip pixels lighter than ~230 gray)
         organic: If True, adds randomness and easing for hand-drawn look
         random_seed: Optional seed for reproducible randomness (used with y coordinate)
         frequency_only: If True, modulates only frequency (not amplitude) based on darkness
+        x_positions: Optional precomputed array of x coordinates (0..width-1)
         
     Returns:
-        List of line segments, where each segment is a list of (x, y) coordinate tuples
+        List of line segments, where each segment is an (xs, ys) pair of coordinate arrays
     """
-    segments = []
-    current_segment = []
+    if x_positions is None:
+        x_positions = np.arange(width, dtype=np.float32)
+    darkness = np.asarray(darkness_values)
+    
+    # Generate organic variation parameters for this line, seeding the generator
+    # from the y position for consistent but varied results
+    if organic:
+        rng = np.random.default_rng(None if random_seed is None else random_seed + int(y * 1000))
+        organic_phase_offset = rng.uniform(0, 2 * math.pi)
+        organic_freq_variation = rng.uniform(0.8, 1.2)
+        organic_wobble = rng.random(width, dtype=np.float32) - 0.5
+    else:
+        organic_phase_offset = 0
+        organic_freq_variation = 1.0
+    
+    # Modulate amplitude and/or frequency based on darkness
+    # Frequency modulation (both modes)
+    base_frequency = 0.1
+    frequency = base_frequency + darkness * 0.2
+    
+    # Amplitude modulation
+    if frequency_only:
+        # Use constant amplitude
+        amplitude = amplitude_scale
+    else:
+        # Default: modulate amplitude based on darkness
+        amplitude = darkness * amplitude_scale
+    
+    # Apply organic frequency variation
+    if organic:
+        frequency = frequency * organic_freq_variation
+    
+    # Calculate wave offset for the whole row at once
+    wave_offset = amplitude * np.sin(x_positions * frequency + organic_phase_offset)
+    
+    # Add organic randomness to y position
+    if organic:
+        # Add subtle random wobble (max 0.5 pixels)
+        wave_offset += organic_wobble * darkness
+    
+        # Add easing for smoother, more natural transitions
+        # Use a subtle ease-in-out based on position in the wave cycle
+        wave_offset *= np.sin(x_positions * frequency * 2) * 0.3 + 1.0
+    
+    # Calculate final y positions. The wave stays float32, but absolute positions are
+    # float64 so tall images keep 2-decimal precision far down the page.
+    final_y = wave_offset.astype(np.float64) + y
+    
+    # Skip white/light background areas: find runs of pixels above the threshold.
+    # Padding the mask with False on both sides makes every run have a start and an end.
+    mask = np.concatenate(([False], darkness >= darkness_threshold, [False]))
+    edges = np.diff(mask.astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    
+    # Slices are views, so segments share memory with the row arrays
+    segments = [(x_positions[start:end], final_y[start:end]) for start, end in zip(starts, ends)]
     
-    # Set random seed based on y position for consistent but varied results
-    if organic and random_seed is not None:
-        random.seed(random_seed + int(y * 1000))
-    
-    # Generate organic variation parameters for this line
-    organic_phase_offset = random.uniform(0, 2 * math.pi) if organic else 0
-    organic_freq_variation = random.uniform(0.8, 1.2) if organic else 1.0
+    return segments
+
+
+def segment_span(xs):
+    """
+    Get the x range covered by a line segment as a slice.
+    Segments are runs of consecutive pixel columns, so the slice selects
+    exactly their points without building an index array.
     
-    for x in range(width):
-        darkness = darkness_values[x]
-        
-        # Skip white/light background areas
-        if darkness < darkness_threshold:
-            # End current segment if we have one
-            if current_segment:
-                segments.append(current_segment)
-                current_segment = []
-            continue
-        
-        # Modulate amplitude and/or frequency based on darkness
-        # Frequency modulation (both modes)
-        base_frequency = 0.1
-        frequency = base_frequency + (darkness * 0.2)
-        
-        # Amplitude modulation
-        if frequency_only:
-            # Use constant amplitude
-            amplitude = amplitude_scale
-        else:
-            # Default: modulate amplitude based on darkness
-            amplitude = darkness * amplitude_scale
-        
-        # Apply organic frequency variation
-        if organic:
-            frequency *= organic_freq_variation
-        
-        # Calculate wave offset
-        wave_offset = amplitude * math.sin(x * frequency + organic_phase_offset)
-        
-        # Add organic randomness to y position
-        if organic:
-            # Add subtle random wobble (max 0.5 pixels)
-            random_wobble = random.uniform(-0.5, 0.5) * darkness
-            wave_offset += random_wobble
-            
-            # Add easing for smoother, more natural transitions
-            # Use a subtle ease-in-out based on position in the wave cycle
-            ease_factor = (math.sin(x * frequency * 2) * 0.3 + 1.0)
-            wave_offset *= ease_factor
-        
-        # Calculate final y position
-        final_y = y + wave_offset
+    Args:
+        xs: Array of x coordinates of the segment
         
-        current_segment.append((x, final_y))
-    
-    # Don't forget the last segment
-    if current_segment:
-        segments.append(current_segment)
+    Returns:
+        Slice of x positions covered by the segment
+    """
+    start = int(xs[0])
+    return slice(start, start + len(xs))
+
+
+def build_y_lookup(segments, width):
+    """
+    Index line segments by x position for constant-time collision lookups.
     
-    return segments
+    Args:
+        segments: List of (xs, ys) line segments from one line
+        width: Image width
+        
+    Returns:
+        Array of y values indexed by x, with -inf where the line has no point
+    """
+    y_lookup = np.full(width, -np.inf)
+    for xs, ys in segments:
+        y_lookup[segment_span(xs)] = ys
+    return y_lookup
 
 
-def check_segment_collision(prev_segments, curr_segments, min_clearance=1.0):
+def check_segment_collision(prev_y_lookup, curr_segments, min_clearance=1.0):
     """
     Check if any segments from two consecutive lines are too close or touching.
     
     Args:
-        prev_segments: List of line segments from previous line
+        prev_y_lookup: Y values of the previous line indexed by x (see build_y_lookup)
         curr_segments: List of line segments from current line
         min_clearance: Minimum required distance between lines
         
     Returns:
         Tuple of (has_collision, min_distance_found)
     """
-    if not prev_segments or not curr_segments:
+    if prev_y_lookup is None or not curr_segments:
         return False, float('inf')
     
     min_distance = float('inf')
     
-    # Check each current segment against all previous segments
-    for curr_segment in curr_segments:
-        for prev_segment in prev_segments:
-            # Check overlapping x ranges
-            curr_x_min = curr_segment[0][0]
-            curr_x_max = curr_segment[-1][0]
-            prev_x_min = prev_segment[0][0]
-            prev_x_max = prev_segment[-1][0]
-            
-            # Check if segments overlap in x dimension
-            if curr_x_max >= prev_x_min and curr_x_min <= prev_x_max:
-                # Check vertical distance at overlapping points
-                for curr_x, curr_y in curr_segment:
-                    # Find corresponding point in prev_segment
-                    for prev_x, prev_y in prev_segment:
-                        if abs(curr_x - prev_x) < 1:  # Same x position (within 1 pixel)
-                            distance = abs(curr_y - prev_y)
-                            min_distance = min(min_distance, distance)
+    # Compare each current point with the previous line at the same x position.
+    # Positions the previous line doesn't cover hold -inf, giving an infinite distance.
+    for curr_xs, curr_ys in curr_segments:
+        prev_ys = prev_y_lookup[segment_span(curr_xs)]
+        min_distance = min(min_distance, float(np.abs(curr_ys - prev_ys).min()))
     
     has_collision = min_distance < min_clearance
     return has_collision, min_distance
 
 
-def adjust_segments_for_clearance(curr_segments, prev_segments, min_clearance=1.0):
+def adjust_segments_for_clearance(curr_segments, prev_y_lookup, min_clearance=1.0):
     """
     Adjust current line segments to maintain minimum clearance from previous line segments.
     
     Args:
         curr_segments: List of line segments from current line to adjust
-        prev_segments: List of line segments from previous line
+        prev_y_lookup: Y values of the previous line indexed by x (see build_y_lookup)
         min_clearance: Minimum required distance between lines
         
     Returns:
         Adjusted list of line segments
     """
-    if not prev_segments:
+    if prev_y_lookup is None:
         return curr_segments
     
     adjusted_segments = []
     
-    for curr_segment in curr_segments:
-        adjusted_segment = []
-        
-        for x, y in curr_segment:
-            adjusted_y = y
-            
-            # Check against all previous segments
-            for prev_segment in prev_segments:
-                # Find closest point in previous segment at similar x
-                for prev_x, prev_y in prev_segment:
-                    if abs(x - prev_x) < 1:  # Same x position
-                        # Ensure current point stays below previous with minimum clearance
-                        if adjusted_y < prev_y + min_clearance:
-                            adjusted_y = prev_y + min_clearance
-                        break
-            
-            adjusted_segment.append((x, adjusted_y))
-        
-        adjusted_segments.append(adjusted_segment)
+    for curr_xs, curr_ys in curr_segments:
+        # Ensure current points stay below previous with minimum clearance
+        prev_ys = prev_y_lookup[segment_span(curr_xs)]
+        adjusted_segments.append((curr_xs, np.maximum(curr_ys, prev_ys + min_clearance)))
     
     return adjusted_segments
 
 
-def generate_svg(grayscale_img, line_spacing=5, amplitude_scale=10, organic=False, frequency_only=False, output_path=None):
+def format_points(xs, ys):
     """
-    Generate SVG from grayscale image with segmented horizontal paths.
-    Only generates lines where content exists (skips white/light background).
-    Automatically adjusts spacing to prevent line collisions.
+    Format segment coordinates as an SVG points attribute value.
+    
+    Args:
+        xs: Array of x coordinates
+        ys: Array of y coordinates
+        
+    Returns:
+        String of space-separated "x,y" pairs with 2 decimal places
+    """
+    # Interleave coordinates so a single %-format call handles the whole segment in C
+    points = np.empty(2 * len(xs))
+    points[0::2] = xs
+    points[1::2] = ys
+    return ' '.join(['%.2f,%.2f'] * len(xs)) % tuple(points.tolist())
+
+
+def map_rows(func, rows, workers=None):
+    """
+    Apply a function to each row's arguments on a thread pool, yielding results in row order.
+    At most a few rows per worker are in flight, so memory stays bounded on tall images.
+    
+    Args:
+        func: Function to call for each row
+        rows: Iterable of argument tuples, one per row
+        workers: Number of worker threads (None = one per CPU, 1 = run serially)
+        
+    Returns:
+        Generator of results, in the same order as rows
+    """
+    if workers is None:
+        workers = min(32, os.cpu_count() or 1)
+    
+    if workers <= 1:
+        for args in rows:
+            yield func(*args)
+        return
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for args in rows:
+            pending.append(executor.submit(func, *args))
+            if len(pending) >= workers * 4:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def write_svg(out, grayscale_img, line_spacing=5, amplitude_scale=10, organic=False, frequency_only=False,
+              darkness_threshold=0.1, workers=1):
+    """
+    Stream SVG markup for a grayscale image to a binary file object.
+    Polylines are written as each row is generated, so the full document
+    is never held in memory.
     
     Args:
+        out: Writable binary file object
         grayscale_img: PIL Image in grayscale mode
         line_spacing: Vertical spacing between horizontal lines
         amplitude_scale: Scaling factor for wave amplitude
         organic: If True, adds randomness and easing for hand-drawn look
         frequency_only: If True, modulates only frequency (not amplitude) based on darkness
-        output_path: Path to save the SVG file (optional)
+        darkness_threshold: Minimum darkness to draw a line (0.1 = skip pixels lighter than ~230 gray)
+        workers: Number of threads generating rows (default 1 = run serially, None = one per CPU)
         
     Returns:
-        SVG content as string
+        Tuple of (collision_count, total_lines)
     """
     width, height = grayscale_img.size
     
@@ -234,84 +299,130 @@ def generate_svg(grayscale_img, line_spacing=5, amplitude_scale=10, organic=Fals
     # Random seed for organic mode (use consistent seed for reproducible results)
     random_seed = 42 if organic else None
     
+    # Raw 8-bit gray values; darkness is only computed for the rows that get sampled
+    gray_values = np.asarray(grayscale_img)
+    x_positions = np.arange(width, dtype=np.float32)
+    
     # Start SVG content
-    svg_lines = [
-        '<?xml version="1.0" encoding="UTF-8"?>',
-        f'<svg xmlns="http://www.w3.org/2000/svg" width="{svg_width}" height="{svg_height}" viewBox="0 0 {svg_width} {svg_height}">',
-        f'  <desc>Polargraph SVG - Generated from image{" with organic style" if organic else " with collision prevention"}</desc>',
-        '  <g fill="none" stroke="black" stroke-width="0.5" stroke-linecap="round" stroke-linejoin="round">'
-    ]
-    
-    # Track previous line segments for collision detection
-    prev_line_segments = None
+    out.write((
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{svg_width}" height="{svg_height}" viewBox="0 0 {svg_width} {svg_height}">\n'
+        f'  <desc>Polargraph SVG - Generated from image{" with organic style" if organic else " with collision prevention"}</desc>\n'
+        '  <g fill="none" stroke="black" stroke-width="0.5" stroke-linecap="round" stroke-linejoin="round">\n'
+    ).encode('utf-8'))
+    
+    # Track previous line (indexed by x) for collision detection
+    prev_y_lookup = None
     collision_count = 0
-    total_lines = 0
+    
+    # Sample line positions up front; y stays fractional, its integer part selects the pixel row
+    # Multiplying an integer count avoids accumulating error, and the mask drops a last
+    # sample that rounds to exactly height (e.g. 30 * 0.7 == 21.0)
+    y_samples = np.arange(int(math.ceil(height / line_spacing))) * float(line_spacing)
+    y_samples = y_samples[y_samples < height]
+    y_rows = y_samples.astype(np.intp)
+    total_lines = len(y_samples)
+    
+    # Convert only the sampled pixel rows to darkness values (0=white, 1=black).
+    # Single precision is plenty for 2-decimal output and doubles the SIMD width.
+    darkness_rows = get_pixel_darkness(gray_values[y_rows].astype(np.float32))
+    
+    # Skip entirely white rows before doing any wave work
+    # (initial=0.0 keeps zero-width images working: they have no pixels to draw)
+    drawn_rows = np.flatnonzero(darkness_rows.max(axis=1, initial=0.0) >= darkness_threshold)
+    
+    # Generate wavy line segments based on darkness (skips white background).
+    # Rows are independent, so they are generated in parallel; collision handling
+    # and output below depend on the previous line and run in row order.
+    row_generator = partial(generate_wave_line_segments, darkness_threshold=darkness_threshold,
+                            organic=organic, random_seed=random_seed,
+                            frequency_only=frequency_only, x_positions=x_positions)
+    rows = ((float(y_samples[i]), width, darkness_rows[i], line_spacing, amplitude_scale)
+            for i in drawn_rows.tolist())
     
     # Generate horizontal lines
-    # Use floating point arithmetic for line_spacing, convert to int for pixel access
-    y = 0
-    while y < height:
-        total_lines += 1
-        y_int = int(y)
-        
-        # Get pixel darkness values for this row
-        darkness_values = []
-        for x in range(width):
-            pixel_value = grayscale_img.getpixel((x, y_int))
-            darkness = get_pixel_darkness(pixel_value)
-            darkness_values.append(darkness)
-        
-        # Generate wavy line segments based on darkness (skips white background)
-        segments = generate_wave_line_segments(y, width, darkness_values, line_spacing, 
-                                              amplitude_scale, organic=organic, random_seed=random_seed,
-                                              frequency_only=frequency_only)
-        
-        # Skip this row if no segments were generated (all white)
-        if not segments:
-            y += line_spacing
-            continue
-        
+    for segments in map_rows(row_generator, rows, workers):
         # Check for collision with previous line and adjust if needed
         min_clearance = 0.8  # Minimum spacing to prevent pen overlap
-        if prev_line_segments:
-            has_collision, min_dist = check_segment_collision(prev_line_segments, segments, min_clearance)
+        if prev_y_lookup is not None:
+            has_collision, min_dist = check_segment_collision(prev_y_lookup, segments, min_clearance)
             if has_collision:
                 collision_count += 1
-                segments = adjust_segments_for_clearance(segments, prev_line_segments, min_clearance)
+                segments = adjust_segments_for_clearance(segments, prev_y_lookup, min_clearance)
         
-        # Create SVG polyline elements for each segment
-        for segment in segments:
-            if len(segment) >= 2:  # Only draw if segment has at least 2 points
-                points_str = ' '.join([f'{x:.2f},{y:.2f}' for x, y in segment])
-                svg_lines.append(f'    <polyline points="{points_str}"/>')
+        # Write SVG polyline elements for each segment
+        for xs, ys in segments:
+            if len(xs) >= 2:  # Only draw if segment has at least 2 points
+                out.write(b'    <polyline points="')
+                out.write(format_points(xs, ys).encode('ascii'))
+                out.write(b'"/>\n')
         
         # Store current segments for next iteration
-        prev_line_segments = segments
-        
-        # Move to next line
-        y += line_spacing
+        prev_y_lookup = build_y_lookup(segments, width)
     
     # Close SVG tags
-    svg_lines.extend([
-        '  </g>',
-        '</svg>'
-    ])
-    
-    svg_content = '\n'.join(svg_lines)
-    
-    # Save to file if output path is provided
-    if output_path:
-        try:
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(svg_content)
-            print(f"SVG saved to: {output_path}")
-            if collision_count > 0:
-                print(f"Collision prevention: {collision_count}/{total_lines} lines adjusted for clearance")
-        except Exception as e:
-            print(f"Error saving SVG: {e}", file=sys.stderr)
-            sys.exit(1)
-    
-    return svg_content
+    out.write(b'  </g>\n</svg>')
+    
+    return collision_count, total_lines
+
+
+def generate_svg(grayscale_img, line_spacing=5, amplitude_scale=10, organic=False, frequency_only=False, output_path=None,
+                 darkness_threshold=0.1, workers=1):
+    """
+    Generate SVG from grayscale image with segmented horizontal paths.
+    Only generates lines where content exists (skips white/light background).
+    Automatically adjusts spacing to prevent line collisions.
+    
+    Args:
+        grayscale_img: PIL Image in grayscale mode
+        line_spacing: Vertical spacing between horizontal lines
+        amplitude_scale: Scaling factor for wave amplitude
+        organic: If True, adds randomness and easing for hand-drawn look
+        frequency_only: If True, modulates only frequency (not amplitude) based on darkness
+        output_path: Path to save the SVG file (optional)
+        darkness_threshold: Minimum darkness to draw a line (0.1 = skip pixels lighter than ~230 gray)
+        workers: Number of threads generating rows (default 1 = run serially, None = one per CPU)
+        
+    Returns:
+        Path of the saved SVG file if output_path is given (the SVG is streamed
+        straight to disk), otherwise the SVG content as string
+    """
+    options = dict(line_spacing=line_spacing, amplitude_scale=amplitude_scale,
+                   organic=organic, frequency_only=frequency_only, darkness_threshold=darkness_threshold,
+                   workers=workers)
+    
+    # Build the SVG in memory if no output path is provided
+    if not output_path:
+        buffer = io.BytesIO()
+        write_svg(buffer, grayscale_img, **options)
+        return buffer.getvalue().decode('utf-8')
+    
+    # Stream to a temporary file next to the output and only replace the output once
+    # the SVG is complete, so a failure never leaves a truncated or partial file behind
+    temp_path = None
+    try:
+        with tempfile.NamedTemporaryFile('wb', dir=os.path.dirname(output_path) or '.',
+                                         prefix='.polargraph-', suffix='.svg', delete=False) as f:
+            temp_path = f.name
+            collision_count, total_lines = write_svg(f, grayscale_img, **options)
+        
+        # Temporary files are private (0600); give the SVG the usual umask-based mode
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temp_path, 0o666 & ~umask)
+        os.replace(temp_path, output_path)
+    except OSError as e:
+        print(f"Error saving SVG: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+    
+    print(f"SVG saved to: {output_path}")
+    if collision_count > 0:
+        print(f"Collision prevention: {collision_count}/{total_lines} lines adjusted for clearance")
+    
+    return output_path
 
 
 def main():
@@ -366,6 +477,13 @@ Examples:
         help='Modulate only frequency (not amplitude) based on pixel darkness'
     )
     
+    parser.add_argument(
+        '-j', '--workers',
+        type=int,
+        default=1,
+        help='Number of threads used to generate rows (default: 1)'
+    )
+    
     args = parser.parse_args()
     
     # Validate input file exists
@@ -383,6 +501,10 @@ Examples:
         print("Error: Amplitude scale must be non-negative", file=sys.stderr)
         sys.exit(1)
     
+    if args.workers < 1:
+        print("Error: Workers must be at least 1", file=sys.stderr)
+        sys.exit(1)
+    
     print(f"Loading image: {args.input_image}")
     grayscale_img = convert_to_grayscale(args.input_image)
     
@@ -401,7 +523,8 @@ Examples:
         amplitude_scale=args.amplitude_scale,
         organic=args.organic,
         frequency_only=args.frequency_only,
-        output_path=args.output
+        output_path=args.output,
+        workers=args.workers
     )
     
     print("Done!")